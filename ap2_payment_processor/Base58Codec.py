@@ -0,0 +1,50 @@
+"""
+Module Base58Codec.py
+
+AP2 spec: https://ap2-protocol.org/specification/
+Google announcement: https://cloud.google.com/blog/products/ai-machine-learning/announcing-agents-to-payments-ap2-protocol
+
+# MIT License
+#
+# Copyright (c) 2025 Adam Bilbrough
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+
+from typing import Union
+
+# both decoders take values with surrounding whitespace (pasted into the prompt, read from a
+# file); base58 on its own only drops trailing whitespace and based58 none at all
+try:
+    # compiled base58btc (Rust); same output as the pure-Python package but bytes-only input
+    import based58
+
+    def b58encode(data: bytes) -> bytes:
+        return based58.b58encode(data)
+
+    def b58decode(data: Union[str, bytes]) -> bytes:
+        return based58.b58decode((data.encode("ascii") if isinstance(data, str) else data).strip())
+except ImportError:
+    import base58
+
+    def b58encode(data: bytes) -> bytes:
+        return base58.b58encode(data)
+
+    def b58decode(data: Union[str, bytes]) -> bytes:
+        return base58.b58decode(data.strip())
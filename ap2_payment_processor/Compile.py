@@ -2,18 +2,10 @@ import subprocess
 import sys
 import os
 
-SOURCE_FILES = [
-    "PaymentProcessor.py",
-    "KeyManager.py",
-    "CryptoLedger.py",
-    "JSONFactory.py",
-    "MandateFactory.py",
-    "MandateSigner.py",
-]
-
+# Every module is imported from Main.py, so --follow-imports already picks them up.
 ENTRY_FILE = "Main.py"
 
-def compile_with_nuitka(entry_file: str, extra_modules: list, output_dir: str = "dist"):
+def compile_with_nuitka(entry_file: str, extra_modules: list = (), output_dir: str = "dist", pgo: bool = False):
     if not os.path.isfile(entry_file):
         print(f"[Error] Entry file '{entry_file}' not found.")
         sys.exit(1)
@@ -24,19 +16,27 @@ def compile_with_nuitka(entry_file: str, extra_modules: list, output_dir: str =
         "--output-dir=" + output_dir,
         "--remove-output",
         "--follow-imports",
-        "--standalone",
         "--onefile",
+        "--lto=yes",
+        "--python-flag=no_site",
+        "--python-flag=no_asserts",
+        "--enable-plugin=anti-bloat",
         "--enable-plugin=pylint-warnings",
         "--show-modules",
     ]
 
+    # only modules loaded dynamically (not via import) need naming explicitly
     for module in extra_modules:
         mod_name = os.path.splitext(os.path.basename(module))[0]
         cmd.append(f"--include-module={mod_name}")
 
+    if pgo:
+        # two-phase C profile-guided build: Nuitka runs the instrumented binary, then rebuilds
+        cmd.append("--pgo-c")
+
     print("[Build] Compiling with Nuitka...")
     subprocess.run(cmd, check=True)
     print("[Build] Compilation finished.")
 
 if __name__ == "__main__":
-    compile_with_nuitka(ENTRY_FILE, SOURCE_FILES)
+    compile_with_nuitka(ENTRY_FILE, pgo="--pgo" in sys.argv[1:])
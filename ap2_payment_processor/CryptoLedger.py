@@ -27,16 +27,104 @@ Google announcement: https://cloud.google.com/blog/products/ai-machine-learning/
 # SOFTWARE.
 """
 
-import json
-from datetime import datetime
-from typing import Dict, Any
-
-import base58
-
+import calendar
+import multiprocessing
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from decimal import Decimal
+from typing import Dict, Any, Iterable, Optional, Tuple
+
+from Base58Codec import b58decode, b58encode
+from JSONFactory import json_dumps_indented
 from KeyManager import KeyManager
+from LedgerWriter import LedgerWriter
+from MandateFactory import mandate_utc_now
 from MandateSigner import MandateSigner
 
 
+VERIFIED_CACHE_SIZE = 4096
+LEDGER_DELIMITER = b"----- TRANSACTION COMPLETED -----"
+LEDGER_ENTRY_HEADER = LEDGER_DELIMITER + b"\n"
+# fields range-checked like datetime.strptime("%Y-%m-%dT%H:%M:%SZ"), which the expiry check
+# used to call; the day is checked against its month in _rfc3339_utc_valid
+RFC3339_UTC = re.compile(
+    r"([0-9]{4})-(0[1-9]|1[0-2])-(0[1-9]|[12][0-9]|3[01])"
+    r"T([01][0-9]|2[0-3]):[0-5][0-9]:[0-5][0-9]Z"
+)
+GREEN = "\033[92m"
+RED = "\033[91m"
+RESET = "\033[0m"
+# below this many records add_transactions_bulk stays in-process (add_transactions_batch);
+# process pool start-up isn't worth it
+BULK_MIN_RECORDS = 64
+# bulk workers start from a fresh process, not a fork of this one: the ledger writer and
+# verify pool threads may hold locks a forked child would inherit
+BULK_MP_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+
+def _to_decimal(value) -> Decimal:
+    """Exact amount for comparisons; str() first so 5.0 and "5.00" compare equal without float noise."""
+    return Decimal(str(value))
+
+
+def _rfc3339_utc_valid(value) -> bool:
+    """True for a real 'YYYY-MM-DDTHH:MM:SSZ' instant (no month 13, no 30 February)."""
+    if type(value) is not str:
+        return False
+    m = RFC3339_UTC.fullmatch(value)
+    if m is None:
+        return False
+    day = int(m.group(3))
+    if m.group(1) == "0000":
+        return False
+    return day <= 28 or day <= calendar.monthrange(int(m.group(1)), int(m.group(2)))[1]
+
+
+def _intern(value):
+    """Intern low-cardinality strings (currency, merchant, issuer) so repeats share one object."""
+    return sys.intern(value) if type(value) is str else value
+
+
+# issuer -> raw pubkey, installed once per worker process by _bulk_worker_init
+_worker_pubkeys: Dict[str, bytes] = {}
+# triples this worker has already verified; batch-signed Mandates repeat one per batch
+_worker_verified: set = set()
+
+
+def _bulk_worker_init(pubkeys: Dict[str, bytes]) -> None:
+    global _worker_pubkeys
+    _worker_pubkeys = pubkeys
+
+
+def _bulk_verify_worker(txn_record: Dict[str, Any]) -> bool:
+    """Canonicalise and signature-check every Mandate of one record; no ledger state involved."""
+    for vc in txn_record.get("mandates", []):
+        try:
+            proof = vc["proof"]
+            issuer_id, _ = proof["verificationMethod"].split("#", 1)
+            triple = (
+                _worker_pubkeys[issuer_id],
+                MandateSigner.signed_message(vc),
+                b58decode(proof["proofValue"])
+            )
+        except Exception:
+            return False
+        if triple in _worker_verified:
+            continue
+        if not CryptoLedger.ledger_signature_valid(triple):
+            return False
+        if len(_worker_verified) >= VERIFIED_CACHE_SIZE:
+            _worker_verified.clear()
+        _worker_verified.add(triple)
+    return True
+
+
 class CryptoLedger:
     """
     - Verifies the signatures of all mandates.
@@ -46,30 +134,73 @@ class CryptoLedger:
     """
     def __init__(self, trusted_issuers: Dict[str, str], key_manager: KeyManager):
         self.trusted_issuers = trusted_issuers
+        # base58btc pubkey -> raw bytes, so each trusted key is decoded once; see ledger_trusted_pubkey
+        self._trusted_raw: Dict[str, bytes] = {}
         self.key_manager = key_manager
         self.transactions = []
         self.revoked_ids = set()
+        self._verify_pool = None
+        # (pubkey, canonical body, signature) -> verified; a hit skips the Ed25519 verify
+        self._verified: "OrderedDict[Tuple[bytes, bytes, bytes], bool]" = OrderedDict()
+        # id -> record for every record add_transaction admitted (the reference keeps the id
+        # from being reused), so reporting knows they passed the consistency check
+        self._admitted: Dict[int, Dict[str, Any]] = {}
+        # struct-of-arrays view of self.transactions for reporting, see ledger_sync_report_view
+        self._txn_ids: list[str] = []
+        self._senders: list[str] = []
+        self._receivers: list[str] = []
+        # amounts as recorded, so the report prints them as the record has them
+        self._amounts: list[Any] = []
+        self._currencies: list[str] = []
+        self._verdicts = bytearray()
+        self._mandate_rows: list[tuple[str, str, str, str, str, str]] = []
+        self._mandate_offsets: list[int] = [0]
+        # VC id -> Mandate over every transaction, see ledger_find_vc
+        self.vc_index: Dict[str, Dict[str, Any]] = {}
+        self._vc_indexed = 0
+        self._writer: Optional[LedgerWriter] = None
+        # held while Mandates are signed, admitted or reported, so a PaymentProcessor batch
+        # flushing on its timer thread never shares the ledger or the module caches with a caller
+        self.lock = threading.RLock()
+        # fdatasync the ledger every N entries; 0 leaves it to the OS
+        self.sync_every = 0
 
     @staticmethod
-    def ledger_parse_rfc3339(ts: str) -> datetime:
-        return datetime.strptime(ts, "%Y-%m-%dT%H:%M:%SZ")
+    def ledger_now() -> str:
+        """Current UTC time as an RFC3339 'YYYY-MM-DDTHH:MM:SSZ' string."""
+        return mandate_utc_now()
 
-    def ledger_not_expired(self, vc: Dict[str, Any]) -> bool:
+    def ledger_not_expired(self, vc: Dict[str, Any], now: Optional[str] = None) -> bool:
+        """Fixed-width RFC3339 UTC timestamps sort chronologically, so a valid one compares as a string."""
         exp = vc.get("expirationDate")
         if not exp:
             return True
-        try:
-            return datetime.utcnow() < self.ledger_parse_rfc3339(exp)
-        except Exception:
+        if not _rfc3339_utc_valid(exp):
             print(f"[expiry] malformed expirationDate: {exp}")
             return False
+        return (now or self.ledger_now()) < exp
+
+    def ledger_revoke(self, vc_id: str) -> None:
+        """Revoke a VC; later mandates carrying this id are rejected."""
+        self.revoked_ids.add(vc_id)
 
     def ledger_not_revoked(self, vc: Dict[str, Any]) -> bool:
         vc_id = vc.get("id")
         if not vc_id:
             print("[revocation] missing VC id")
             return False
-        return vc_id not in self.revoked_ids
+        # the revocation list is usually empty; str hashes are cached, so a hit is one probe
+        return not self.revoked_ids or vc_id not in self.revoked_ids
+
+    def ledger_trusted_pubkey(self, issuer: str) -> Optional[bytes]:
+        """The issuer's raw pubkey from trusted_issuers (read on every call), or None if untrusted."""
+        b58 = self.trusted_issuers.get(issuer)
+        if b58 is None:
+            return None
+        raw = self._trusted_raw.get(b58)
+        if raw is None:
+            raw = self._trusted_raw[b58] = b58decode(b58)
+        return raw
 
     def ledger_issuer_trusted(self, mandate: Dict[str, Any]) -> bool:
         proof = mandate.get("proof", {})
@@ -80,18 +211,21 @@ class CryptoLedger:
             print("[issuer] missing issuer or verificationMethod")
             return False
 
-        expected_pub_b58 = self.trusted_issuers.get(issuer)
-        if not expected_pub_b58:
+        try:
+            expected_pub = self.ledger_trusted_pubkey(issuer)
+        except Exception as e:
+            print(f"[issuer] malformed trusted key for {issuer}: {e}")
+            return False
+        if not expected_pub:
             print(f"[issuer] untrusted issuer: {issuer}")
             return False
 
         try:
             resolved_pub = self.key_manager.key_resolve_verification_method(vm)
-            resolved_pub_b58 = base58.b58encode(resolved_pub).decode("ascii")
-            if resolved_pub_b58 != expected_pub_b58:
+            if resolved_pub != expected_pub:
                 print("[issuer] verificationMethod key mismatch for issuer")
-                print(f"  expected: {expected_pub_b58}")
-                print(f"  resolved: {resolved_pub_b58}")
+                print(f"  expected: {b58encode(expected_pub).decode('ascii')}")
+                print(f"  resolved: {b58encode(resolved_pub).decode('ascii')}")
                 return False
         except Exception as e:
             print(f"[issuer] failed to resolve verificationMethod: {e}")
@@ -99,24 +233,106 @@ class CryptoLedger:
 
         return True
 
-    def ledger_verify_mandate(self, mandate: Dict[str, Any]) -> bool:
-        """
-        VC'ing of Mandates (A VC'd Mandate is a verified and signed Mandate)
-        :param mandate:
-        :return:
-        """
+    def ledger_verify_metadata(self, mandate: Dict[str, Any], now: Optional[str] = None) -> bool:
+        """Issuer, expiry and revocation checks of a Mandate (everything but the signature)."""
         if not self.ledger_issuer_trusted(mandate):
             return False
-        if not self.ledger_not_expired(mandate):
+        if not self.ledger_not_expired(mandate, now):
             print("[expiry] mandate expired")
             return False
         if not self.ledger_not_revoked(mandate):
             print("[revocation] mandate revoked")
             return False
-        ok = MandateSigner.verify(mandate, self.key_manager)
-        if not ok:
+        return True
+
+    def ledger_verify_mandate(self, mandate: Dict[str, Any]) -> bool:
+        """
+        VC'ing of Mandates (A VC'd Mandate is a verified and signed Mandate)
+        :param mandate:
+        :return:
+        """
+        if not self.ledger_verify_metadata(mandate):
+            return False
+        try:
+            triple = self.ledger_signature_parts(mandate)
+        except Exception:
+            # let the signer report exactly what is malformed
+            return MandateSigner.verify(mandate, self.key_manager)
+        if self.ledger_is_verified(triple):
+            return True
+        if not self.ledger_signature_valid(triple):
             print("[signature] verification failed")
-        return ok
+            return False
+        self.ledger_remember_verified(triple)
+        return True
+
+    def ledger_signature_parts(self, mandate: Dict[str, Any]) -> Tuple[bytes, bytes, bytes]:
+        """A Mandate's (pubkey, signed message, signature), the pubkey from trusted_issuers; raises KeyError."""
+        issuer = mandate["issuer"]
+        pubkey = self.ledger_trusted_pubkey(issuer)
+        if pubkey is None:
+            raise KeyError(issuer)
+        return (
+            pubkey,
+            MandateSigner.signed_message(mandate),
+            b58decode(mandate["proof"]["proofValue"])
+        )
+
+    @staticmethod
+    def ledger_signature_valid(triple: Tuple[bytes, bytes, bytes]) -> bool:
+        return MandateSigner.signature_valid(triple)
+
+    def ledger_batch_verify(self, mandates: list[Dict[str, Any]]) -> bool:
+        """Verifies all Mandates of a batch, checking each distinct signature once on the verify pool."""
+        now = self.ledger_now()
+        # triple -> first Mandate carrying it, in order, for the failure message
+        pending: Dict[Tuple[bytes, bytes, bytes], Dict[str, Any]] = {}
+        for vc in mandates:
+            if not self.ledger_verify_metadata(vc, now):
+                return False
+            try:
+                triple = self.ledger_signature_parts(vc)
+            except KeyError as e:
+                print(f"[verify] missing field: {e}")
+                return False
+            except Exception as e:
+                print(f"[verify] verification error: {e}")
+                return False
+            if not self.ledger_is_verified(triple):
+                pending.setdefault(triple, vc)
+
+        if not pending:
+            return True
+        for (triple, vc), ok in zip(pending.items(), self.ledger_signatures_valid(pending)):
+            if not ok:
+                print(f"[signature] verification failed for {vc['type'][-1]} ({vc.get('id')})")
+                return False
+            self.ledger_remember_verified(triple)
+        return True
+
+    def ledger_verify_pool(self) -> ThreadPoolExecutor:
+        if self._verify_pool is None:
+            self._verify_pool = ThreadPoolExecutor(max_workers=os.cpu_count())
+        return self._verify_pool
+
+    def ledger_signatures_valid(self, triples: Iterable[Tuple[bytes, bytes, bytes]]) -> list[bool]:
+        """ledger_signature_valid over the verify pool, or inline once it is shut down (at exit)."""
+        try:
+            return list(self.ledger_verify_pool().map(self.ledger_signature_valid, triples))
+        except RuntimeError:
+            return [self.ledger_signature_valid(triple) for triple in triples]
+
+    def ledger_is_verified(self, triple: Tuple[bytes, bytes, bytes]) -> bool:
+        """LRU lookup of signatures verified before, keyed by the whole verification input."""
+        if triple in self._verified:
+            self._verified.move_to_end(triple)
+            return True
+        return False
+
+    def ledger_remember_verified(self, triple: Tuple[bytes, bytes, bytes]) -> None:
+        self._verified[triple] = True
+        if len(self._verified) > VERIFIED_CACHE_SIZE:
+            self._verified.popitem(last=False)
 
     def ledger_vc_previous(self, vc: Dict[str, Any]) -> str:
         return vc.get("credentialSubject", {}).get("prev_mandate_id")
@@ -125,159 +341,262 @@ class CryptoLedger:
         return vc.get("id")
 
     def ledger_verify_chain(self, mandates: list[Dict[str, Any]]) -> bool:
-        for prev, curr in zip(mandates, mandates[1:]):
-            if self.ledger_vc_previous(curr) != self.ledger_vc_id(prev):
-                print(f"[chain] mismatch: {curr['type'][-1]}.prev={self.ledger_vc_previous(curr)} "
-                      f"vs {prev['type'][-1]}.id={self.ledger_vc_id(prev)}")
-                return False
-        return True
-
-    def add_transaction(self, txn_record: Dict[str, Any]) -> bool:
+        """Checks every link of one transaction's Mandate chain, on every call."""
+        if len(mandates) < 2:
+            return True
+        ids = [self.ledger_vc_id(m) for m in mandates]
+        prevs = [self.ledger_vc_previous(m) for m in mandates]
+        if prevs[1:] == ids[:-1]:
+            return True
+        for i in range(1, len(mandates)):
+            if prevs[i] != ids[i - 1]:
+                print(f"[chain] mismatch: {mandates[i]['type'][-1]}.prev={prevs[i]} "
+                      f"vs {mandates[i - 1]['type'][-1]}.id={ids[i - 1]}")
+                break
+        return False
+
+    def add_transaction(self, txn_record: Dict[str, Any], verify_signatures: bool = True) -> bool:
         """
         Transaction processing of Mandates
 
         A complete batch of Mandates (3/4 if Netting is used), constitutes 1 Transaction
         """
-        mandates = txn_record.get("mandates", [])
-        if not mandates:
-            print("Invalid flow: no mandates.")
-            return False
+        with self.lock:
+            mandates = txn_record.get("mandates", [])
+            # verify_signatures=False is only for callers that already checked the signatures
+            if not mandates:
+                print("Invalid flow: no mandates.")
+                return False
 
-        for vc in mandates:
-            if not self.ledger_verify_mandate(vc):
+            if verify_signatures:
+                verified = self.ledger_batch_verify(mandates)
+            else:
+                now = self.ledger_now()
+                verified = all(self.ledger_verify_metadata(vc, now) for vc in mandates)
+            if not verified:
                 print("Signature/metadata verification failed.")
                 return False
 
-        if not self.ledger_verify_chain(mandates):
-            print("Chain verification failed.")
-            return False
+            if not self.ledger_verify_chain(mandates):
+                print("Chain verification failed.")
+                return False
 
-        if len(mandates) >= 3 and mandates[0]["type"][-1] == "IntentMandate":
-            intent_vc, cart_vc, payment_vc = mandates[:3]
             try:
-                intent_subject = intent_vc["credentialSubject"]
-                amount_intent = float(intent_subject["details"]["amount"])
-                currency_intent = intent_subject["details"]["currency"]
-                receiver_intent = intent_subject["merchant_id"]
-
-                cart_subject = cart_vc["credentialSubject"]
-                cart_details = cart_subject["contents"]["payment_request"]["details"]
-                total_cart = float(cart_details["total"]["amount"]["value"])
-                currency_cart = cart_details["total"]["amount"]["currency"]
-                receiver_cart = cart_subject["merchant_id"]
-
-                payment_subject = payment_vc["credentialSubject"]
-                payment_details = payment_subject["payment_details"]
-                amount_payment = float(payment_details["amount"])
-                currency_payment = payment_details["currency"]
-                receiver_payment = payment_subject["merchant_id"]
-
-                if not (
-                        amount_intent == total_cart == amount_payment
-                        and currency_intent == currency_cart == currency_payment
-                        and receiver_intent == receiver_cart == receiver_payment
-                ):
-                    print("Amount/currency/receiver mismatch across mandates.")
-                    return False
-
+                consistent = self.ledger_summarize(txn_record)
             except Exception as e:
                 print(f"Mandate structure mismatch: {e}")
                 return False
+            if not consistent:
+                print("Amount/currency/receiver mismatch across mandates.")
+                return False
 
-        self.transactions.append(txn_record)
-        return True
+            self.transactions.append(txn_record)
+            self._admitted[id(txn_record)] = txn_record
+            return True
 
-    def transaction_report(self):
-        """Handles the Ledger report."""
-        green = "\033[92m"
-        red = "\033[91m"
-        reset = "\033[0m"
-
-        print("\nLedger Report:")
-        total = len(self.transactions)
-        consistent_count = 0
-        inconsistent_count = 0
-
-        for txn in self.transactions:
-            print("=" * 70)
-            print(
-                f"TXN {txn['transaction_id']} | "
-                f"{txn['sender']} -> {txn['receiver']} "
-                f"{txn['amount']} {txn['currency']}"
-            )
+    def add_transactions_batch(self, txns: list[Dict[str, Any]]) -> list[bool]:
+        """Admits many transactions with a single signature pass."""
+        with self.lock:
+            # a dict keeps order and drops repeats: batch-signed Mandates share one (key, root, sig)
+            triples = {}
+            try:
+                for txn in txns:
+                    for vc in txn.get("mandates", []):
+                        triple = self.ledger_signature_parts(vc)
+                        if not self.ledger_is_verified(triple):
+                            triples[triple] = None
+            except Exception:
+                return [self.add_transaction(txn) for txn in txns]
+
+            if not all(self.ledger_signatures_valid(triples)):
+                return [self.add_transaction(txn) for txn in txns]
+            for triple in triples:
+                self.ledger_remember_verified(triple)
+            return [self.add_transaction(txn, verify_signatures=False) for txn in txns]
+
+    def add_transactions_bulk(self, records: list[Dict[str, Any]]) -> list[bool]:
+        """Bulk ingest (replay, audit): signatures are checked in a process pool, the rest in order."""
+        with self.lock:
+            if len(records) < BULK_MIN_RECORDS:
+                return self.add_transactions_batch(records)
+
+            pubkeys = self.key_manager.key_export_raw_public_keys()
+            with ProcessPoolExecutor(
+                    mp_context=BULK_MP_CONTEXT, initializer=_bulk_worker_init, initargs=(pubkeys,)
+            ) as ex:
+                signatures_ok = list(ex.map(_bulk_verify_worker, records, chunksize=16))
+
+            results = []
+            for rec, ok in zip(records, signatures_ok):
+                if not ok:
+                    print(f"[signature] verification failed in transaction {rec.get('transaction_id')}")
+                results.append(ok and self.add_transaction(rec, verify_signatures=False))
+            return results
 
-            print("Mandate Chain:")
-            for idx, m in enumerate(txn['mandates'], start=1):
-                mandate_type = m["type"][-1]
+    @staticmethod
+    def ledger_summarize(txn: Dict[str, Any]) -> bool:
+        """Cross-checks amount/currency/receiver across an intent chain; raises if it is malformed."""
+        mandates = txn.get("mandates", [])
+        if len(mandates) >= 3 and mandates[0]["type"][-1] == "IntentMandate":
+            intent_vc, cart_vc, payment_vc = mandates[:3]
+            intent_subject = intent_vc["credentialSubject"]
+            amount_intent = _to_decimal(intent_subject["details"]["amount"])
+            currency_intent = intent_subject["details"]["currency"]
+            receiver_intent = intent_subject["merchant_id"]
+
+            cart_subject = cart_vc["credentialSubject"]
+            cart_details = cart_subject["contents"]["payment_request"]["details"]
+            total_cart = _to_decimal(cart_details["total"]["amount"]["value"])
+            currency_cart = cart_details["total"]["amount"]["currency"]
+            receiver_cart = cart_subject["merchant_id"]
+
+            payment_subject = payment_vc["credentialSubject"]
+            payment_details = payment_subject["payment_details"]
+            amount_payment = _to_decimal(payment_details["amount"])
+            currency_payment = payment_details["currency"]
+            receiver_payment = payment_subject["merchant_id"]
+
+            fields_intent = (amount_intent, currency_intent, receiver_intent)
+            fields_cart = (total_cart, currency_cart, receiver_cart)
+            fields_payment = (amount_payment, currency_payment, receiver_payment)
+            return fields_intent == fields_cart == fields_payment
+        return True
+
+    def ledger_sync_report_view(self) -> None:
+        """Appends report rows for transactions not yet in the struct-of-arrays view."""
+        for txn in self.transactions[len(self._txn_ids):]:
+            # build the whole row first, so a malformed record can't leave the arrays out of step
+            txn_id = txn["transaction_id"]
+            sender = _intern(txn["sender"])
+            receiver = _intern(txn["receiver"])
+            amount = txn["amount"]
+            currency = _intern(txn["currency"])
+            mandate_rows = []
+            for m in txn["mandates"]:
                 subj = m["credentialSubject"]
-                mandate_id = subj.get("mandate_id") or subj.get("refund_id") or subj.get("flag_id")
-                merchant_id = subj.get("merchant_id", "n/a")
-                vc_id = m.get("id", "n/a")
-                exp = m.get("expirationDate", "n/a")
-                issuer = m.get("issuer", "n/a")
-
-                arrow = "└─" if idx == len(txn['mandates']) else "├─"
-                print(
-                    f" {arrow} {mandate_type} "
-                    f"(mandate_id={mandate_id}, vc_id={vc_id})"
-                )
-                print(
-                    f"    merchant={merchant_id} issuer={issuer} exp={exp}"
-                )
-
-            consistent = self.ledger_check_consistency(txn)
-            if consistent:
-                verdict = f"{green}✔ Consistent{reset}"
-                consistent_count += 1
-            else:
-                verdict = f"{red}✘ Inconsistent{reset}"
-                inconsistent_count += 1
-            print(f"Consistency: {verdict}")
+                mandate_rows.append((
+                    _intern(m["type"][-1]),
+                    subj.get("mandate_id") or subj.get("refund_id") or subj.get("flag_id"),
+                    m.get("id", "n/a"),
+                    _intern(subj.get("merchant_id", "n/a")),
+                    m.get("expirationDate", "n/a"),
+                    _intern(m.get("issuer", "n/a")),
+                ))
+            verdict = self.ledger_check_consistency(txn)
+
+            self._txn_ids.append(txn_id)
+            self._senders.append(sender)
+            self._receivers.append(receiver)
+            self._amounts.append(amount)
+            self._currencies.append(currency)
+            self._mandate_rows.extend(mandate_rows)
+            self._mandate_offsets.append(len(self._mandate_rows))
+            self._verdicts.append(verdict)
+
+    def ledger_find_vc(self, vc_id: str) -> Optional[Dict[str, Any]]:
+        """Returns the first Mandate on the ledger with this VC id, or None."""
+        with self.lock:
+            index = self.vc_index
+            for txn in self.transactions[self._vc_indexed:]:
+                for m in txn.get("mandates", []):
+                    index.setdefault(m.get("id"), m)
+            self._vc_indexed = len(self.transactions)
+            return index.get(vc_id)
 
-        print("\nSummary:")
-        print(f" Total transactions: {total}")
-        print(f" {green}{consistent_count} consistent{reset}")
-        print(f" {red}{inconsistent_count} inconsistent{reset}")
+    def transaction_report(self):
+        """Handles the Ledger report. Each transaction is rendered into one buffered write."""
+        with self.lock:
+            self.ledger_sync_report_view()
+            rows = self._mandate_rows
+            offsets = self._mandate_offsets
+            write = sys.stdout.write
+
+            total = len(self._txn_ids)
+            consistent_count = 0
+            inconsistent_count = 0
+
+            write("\nLedger Report:\n")
+            for i in range(total):
+                buf = [
+                    "=" * 70, "\n",
+                    f"TXN {self._txn_ids[i]} | "
+                    f"{self._senders[i]} -> {self._receivers[i]} "
+                    f"{self._amounts[i]} {self._currencies[i]}\n",
+                    "Mandate Chain:\n",
+                ]
+                last = offsets[i + 1] - 1
+                for idx in range(offsets[i], last + 1):
+                    mandate_type, mandate_id, vc_id, merchant_id, exp, issuer = rows[idx]
+                    arrow = "└─" if idx == last else "├─"
+                    buf.append(
+                        f" {arrow} {mandate_type} "
+                        f"(mandate_id={mandate_id}, vc_id={vc_id})\n"
+                        f"    merchant={merchant_id} issuer={issuer} exp={exp}\n"
+                    )
+
+                if self._verdicts[i]:
+                    buf.append(f"Consistency: {GREEN}✔ Consistent{RESET}\n")
+                    consistent_count += 1
+                else:
+                    buf.append(f"Consistency: {RED}✘ Inconsistent{RESET}\n")
+                    inconsistent_count += 1
+                write("".join(buf))
+
+            write(
+                "\nSummary:\n"
+                f" Total transactions: {total}\n"
+                f" {GREEN}{consistent_count} consistent{RESET}\n"
+                f" {RED}{inconsistent_count} inconsistent{RESET}\n"
+            )
 
     def ledger_check_consistency(self, txn: Dict[str, Any]) -> bool:
         """Rerun the cross-checking logic for reporting."""
-        mandates = txn.get("mandates", [])
-        if len(mandates) >= 3 and mandates[0]["type"][-1] == "IntentMandate":
-            try:
-                intent_vc, cart_vc, payment_vc = mandates[:3]
-                intent_subject = intent_vc["credentialSubject"]
-                cart_subject = cart_vc["credentialSubject"]
-                payment_subject = payment_vc["credentialSubject"]
-
-                amount_intent = float(intent_subject["details"]["amount"])
-                currency_intent = intent_subject["details"]["currency"]
-                receiver_intent = intent_subject["merchant_id"]
-
-                cart_details = cart_subject["contents"]["payment_request"]["details"]
-                total_cart = float(cart_details["total"]["amount"]["value"])
-                currency_cart = cart_details["total"]["amount"]["currency"]
-                receiver_cart = cart_subject["merchant_id"]
-
-                payment_details = payment_subject["payment_details"]
-                amount_payment = float(payment_details["amount"])
-                currency_payment = payment_details["currency"]
-                receiver_payment = payment_subject["merchant_id"]
-
-                return (
-                        amount_intent == total_cart == amount_payment
-                        and currency_intent == currency_cart == currency_payment
-                        and receiver_intent == receiver_cart == receiver_payment
-                )
-            except Exception:
-                return False
-        return True
+        if self._admitted.get(id(txn)) is txn:
+            return True
+        try:
+            return self.ledger_summarize(txn)
+        except Exception:
+            return False
+
+    def ledger_open(self, path: str) -> None:
+        """Open (or switch to) the background append writer used by save_to_file."""
+        self.close()
+        self._writer = LedgerWriter(path, self.sync_every)
+
+    def ledger_sync(self) -> None:
+        """Block until every saved entry is on disk (data only where the platform allows it)."""
+        if self._writer is not None:
+            self._writer.writer_flush()
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.writer_close()
+            self._writer = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
 
     def save_to_file(self, path: str, txn_record: Dict[str, Any]) -> None:
         """Append a snapshot of the transaction to a plain text simulated ledger."""
         try:
-            with open(path, "a", encoding="utf-8") as f:
-                f.write("----- TRANSACTION COMPLETED -----\n")
-                f.write(json.dumps(txn_record, indent=2))
-                f.write("\n\n")
+            if self._writer is None or self._writer.path != path:
+                self.ledger_open(path)
+            self._writer.writer_submit(LEDGER_ENTRY_HEADER + json_dumps_indented(txn_record) + b"\n\n")
         except Exception as e:
             print(f"[persistence] failed to write ledger entry: {e}")
+
+    def save_all_to_file(self, path: str, txn_records: list[Dict[str, Any]]) -> None:
+        """save_to_file for many transactions, handed to the writer as a single append."""
+        if not txn_records:
+            return
+        try:
+            if self._writer is None or self._writer.path != path:
+                self.ledger_open(path)
+            self._writer.writer_submit(b"".join(
+                LEDGER_ENTRY_HEADER + json_dumps_indented(txn_record) + b"\n\n" for txn_record in txn_records
+            ))
+        except Exception as e:
+            print(f"[persistence] failed to write ledger entries: {e}")
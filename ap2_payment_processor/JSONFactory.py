@@ -27,22 +27,101 @@ Google announcement: https://cloud.google.com/blog/products/ai-machine-learning/
 # SOFTWARE.
 """
 
+import hashlib
 import json
+import sys
+from collections import OrderedDict
 from pathlib import Path
-from typing import Any, Dict
+from types import MappingProxyType
+from typing import Any, Dict, Optional
 
 from pyld import jsonld
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 CONTEXT_DIR = Path("../contexts")
 
+# canonical N-Quads keyed by a digest of the VC body (sans proof)
+CANONICAL_CACHE_SIZE = 4096
+_canonical_cache: "OrderedDict[bytes, bytes]" = OrderedDict()
+
+
+def json_loads(data):
+    """Parse JSON from str/bytes/memoryview, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
+# members holding per-record values (VC and Mandate ids, hashes, signatures, Merkle proofs):
+# interning those only costs, so they and everything under them are left alone. "id" is
+# handled apart: the schema and status-list URLs under it repeat in every VC.
+INTERN_SKIP_KEYS = frozenset({
+    "mandate_id", "prev_mandate_id", "prev_mandate_ids", "transaction_id",
+    "refund_id", "original_payment_id", "flag_id", "flagged_mandate_id",
+    "cart_mandate_hash", "merchant_signature", "proofValue", "merkleRoot", "merklePath",
+})
+# longer values are free text (labels, notes), which seldom repeats either
+INTERN_MAX_LEN = 64
+
+
+def json_intern_strings(obj: Any) -> Any:
+    """Interns the short string values of a parsed JSON tree in place (see INTERN_SKIP_KEYS) and returns it."""
+    intern = sys.intern
+    skip = INTERN_SKIP_KEYS
+    stack = [obj]
+    while stack:
+        node = stack.pop()
+        is_dict = type(node) is dict
+        for k, v in (node.items() if is_dict else enumerate(node)):
+            if is_dict and (k in skip or k == "id" and not (type(v) is str and v.startswith("https://"))):
+                continue
+            t = type(v)
+            if t is str:
+                if len(v) <= INTERN_MAX_LEN:
+                    node[k] = intern(v)
+            elif t is dict or t is list:
+                stack.append(v)
+    return obj
+
+
+def json_canonical_bytes(obj: Any) -> bytes:
+    """Sorted-key compact UTF-8 JSON, always from the stdlib; raises on NaN, Infinity and non-JSON types."""
+    return json.dumps(
+        obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False, allow_nan=False
+    ).encode("utf-8")
+
+
+def json_cache_bytes(obj: Any) -> Optional[bytes]:
+    """json_canonical_bytes for keying caches on content, or None if the document can't be encoded."""
+    try:
+        return json_canonical_bytes(obj)
+    except (TypeError, ValueError):
+        return None
+
+
+def json_dumps_indented(obj: Any) -> bytes:
+    """Serialize to 2-space indented UTF-8 JSON, with orjson when it is installed."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+        except TypeError:
+            pass  # e.g. integers beyond 64 bit; the stdlib handles those
+    return json.dumps(obj, indent=2).encode("utf-8")
+
 
 def json_load_context_schema_file(filename: str) -> dict:
     """Loads local contexts for validation of schema"""
-    return json.loads((CONTEXT_DIR / filename).read_text(encoding="utf-8"))
+    return json_loads((CONTEXT_DIR / filename).read_bytes())
 
 
-LOCAL_CONTEXTS = {
+LOCAL_CONTEXTS = MappingProxyType({
     "https://www.w3.org/2018/credentials/v1": json_load_context_schema_file("credentials_v1.json"),
     "https://w3id.org/security/v2": json_load_context_schema_file("security_v2.json"),
     "https://w3id.org/security/v1": json_load_context_schema_file("security-v1.json"),
@@ -86,31 +165,59 @@ LOCAL_CONTEXTS = {
             "timestamp": "https://ap2-protocol.org/mandates#timestamp"
         }
     }
-}
+})
+
+# loader results are built once; pyld only reads them
+_LOADER_RESULTS = MappingProxyType({
+    url: {"contextUrl": None, "documentUrl": url, "document": doc}
+    for url, doc in LOCAL_CONTEXTS.items()
+})
 
 
 def json_local_loader(url: str, options=None):
     """Loads the hardcoded schema"""
-    doc = LOCAL_CONTEXTS.get(url)
-    if doc is None:
+    remote_doc = _LOADER_RESULTS.get(url)
+    if remote_doc is None:
         raise Exception(f"No local context for {url}")
-    return {
-        "contextUrl": None,
-        "documentUrl": url,
-        "document": doc
-    }
+    return remote_doc
 
 
-def json_canonicalize_vc_for_signing(vc: Dict[str, Any]) -> bytes:
-    """Initiate canonicalisation"""
+def _vc_body(vc: Dict[str, Any]) -> Dict[str, Any]:
+    """The VC without its proof: copied only when it has one, never modified in place."""
+    if "proof" not in vc:
+        return vc
     body = dict(vc)
-    body.pop("proof", None)
+    del body["proof"]
+    return body
+
+
+def json_canonicalize_vc_for_signing(vc: Dict[str, Any], body_json: Optional[bytes] = None) -> bytes:
+    """Initiate canonicalisation"""
+    # URDNA2015 results are cached by a blake2b digest of the body's json_cache_bytes, which
+    # a caller already holding them (proof excluded) passes as body_json; signing fills it
+    body = None
+    if body_json is None:
+        body = _vc_body(vc)
+        body_json = json_cache_bytes(body)
+    key = None
+    if body_json is not None:
+        key = hashlib.blake2b(body_json, digest_size=16).digest()
+        cached = _canonical_cache.get(key)
+        if cached is not None:
+            _canonical_cache.move_to_end(key)
+            return cached
+
     nquads = jsonld.normalize(
-        body,
+        body if body is not None else _vc_body(vc),
         options={
             "algorithm": "URDNA2015",
             "format": "application/n-quads",
             "documentLoader": json_local_loader,
         },
     )
-    return nquads.encode("utf-8")
+    canonical = nquads.encode("utf-8")
+    if key is not None:
+        _canonical_cache[key] = canonical
+        if len(_canonical_cache) > CANONICAL_CACHE_SIZE:
+            _canonical_cache.popitem(last=False)
+    return canonical
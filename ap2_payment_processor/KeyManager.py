@@ -27,11 +27,12 @@ Google announcement: https://cloud.google.com/blog/products/ai-machine-learning/
 # SOFTWARE.
 """
 
-from typing import Dict
+from typing import Dict, Optional
 
-import base58
 from nacl.signing import SigningKey
 
+from Base58Codec import b58encode
+
 
 class KeyManager:
     """
@@ -39,10 +40,21 @@ class KeyManager:
     """
     def __init__(self):
         self._keys: Dict[str, SigningKey] = {}
+        self._pub_cache: Dict[str, bytes] = {}
+        self._export_cache: Optional[Dict[str, str]] = None
 
     def key_generate_issuer(self, issuer_id: str):
         sk = SigningKey.generate()
         self._keys[issuer_id] = sk
+        self._pub_cache.pop(issuer_id, None)
+        self._export_cache = None
+
+    def key_get_pubkey(self, issuer_id: str) -> bytes:
+        """Return the issuer's raw public key bytes (memoized)."""
+        pub = self._pub_cache.get(issuer_id)
+        if pub is None:
+            pub = self._pub_cache[issuer_id] = bytes(self._keys[issuer_id].verify_key)
+        return pub
 
     def key_get_signer(self, issuer_id: str) -> SigningKey:
         """signs issuer"""
@@ -50,11 +62,17 @@ class KeyManager:
 
     def key_get_pubkey_b58(self, issuer_id: str) -> str:
         """Return the issuer's public key encoded in base58btc."""
-        return base58.b58encode(bytes(self._keys[issuer_id].verify_key)).decode("ascii")
+        return b58encode(self.key_get_pubkey(issuer_id)).decode("ascii")
 
     def key_export_public_keys(self) -> Dict[str, str]:
         """Export all issuers' public keys as base58btc strings."""
-        return {issuer: self.key_get_pubkey_b58(issuer) for issuer in self._keys}
+        if self._export_cache is None:
+            self._export_cache = {issuer: self.key_get_pubkey_b58(issuer) for issuer in self._keys}
+        return dict(self._export_cache)
+
+    def key_export_raw_public_keys(self) -> Dict[str, bytes]:
+        """Export all issuers' raw public key bytes (e.g. to hand to worker processes)."""
+        return {issuer: self.key_get_pubkey(issuer) for issuer in self._keys}
 
     def key_resolve_verification_method(self, vm_uri: str) -> bytes:
         """
@@ -65,5 +83,4 @@ class KeyManager:
             issuer_id, _ = vm_uri.split("#", 1)
         except ValueError:
             raise ValueError(f"Invalid verificationMethod URI: {vm_uri}")
-        pub_b58 = self.key_get_pubkey_b58(issuer_id)
-        return base58.b58decode(pub_b58)
+        return self.key_get_pubkey(issuer_id)
@@ -0,0 +1,107 @@
+"""
+Module LedgerWriter.py
+
+AP2 spec: https://ap2-protocol.org/specification/
+Google announcement: https://cloud.google.com/blog/products/ai-machine-learning/announcing-agents-to-payments-ap2-protocol
+
+# MIT License
+#
+# Copyright (c) 2025 Adam Bilbrough
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+
+import os
+import threading
+from queue import SimpleQueue
+from typing import Union
+
+
+class LedgerWriter:
+    """Appends ledger entries in order from a background thread, so a commit never waits on disk."""
+    def __init__(self, path: str, sync_every: int = 0):
+        flags = (os.O_WRONLY | os.O_CREAT | os.O_APPEND
+                 | getattr(os, "O_BINARY", 0) | getattr(os, "O_CLOEXEC", 0))
+        self.path = path
+        # fdatasync every N entries; 0 leaves it to the OS
+        self.sync_every = sync_every
+        self._fd = os.open(path, flags, 0o644)
+        # bytes = entry, Event = flush marker, None = stop
+        self._queue: "SimpleQueue[Union[bytes, threading.Event, None]]" = SimpleQueue()
+        self._thread = threading.Thread(target=self._writer_run, name="ledger-writer", daemon=True)
+        self._thread.start()
+
+    def writer_submit(self, entry: bytes) -> None:
+        self._queue.put(entry)
+
+    def writer_flush(self) -> None:
+        """Block until every entry submitted so far is written and synced to disk."""
+        if self._thread.is_alive():
+            done = threading.Event()
+            self._queue.put(done)
+            done.wait()
+
+    def writer_close(self) -> None:
+        """Drain the queue, sync anything unsynced and release the descriptor."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _writer_sync(self) -> None:
+        getattr(os, "fdatasync", os.fsync)(self._fd)
+
+    def _writer_write(self, chunks: list) -> None:
+        buf = memoryview(b"".join(chunks))
+        try:
+            while buf:
+                buf = buf[os.write(self._fd, buf):]
+        except OSError as e:
+            print(f"[persistence] failed to write ledger entry: {e}")
+
+    def _writer_run(self) -> None:
+        queue = self._queue
+        unsynced = 0
+        running = True
+        while running:
+            chunks = []
+            waiters = []
+            item = queue.get()
+            while True:
+                if item is None:
+                    running = False
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    chunks.append(item)
+                if not running or queue.empty():
+                    break
+                item = queue.get()
+
+            if chunks:
+                self._writer_write(chunks)
+                unsynced += len(chunks)
+            try:
+                if unsynced and (waiters or not running or (self.sync_every and unsynced >= self.sync_every)):
+                    self._writer_sync()
+                    unsynced = 0
+            except OSError as e:
+                print(f"[persistence] failed to sync ledger: {e}")
+            for waiter in waiters:
+                waiter.set()
+        os.close(self._fd)
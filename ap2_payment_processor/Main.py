@@ -27,34 +27,94 @@ Google announcement: https://cloud.google.com/blog/products/ai-machine-learning/
 # SOFTWARE.
 """
 
-import json
+import atexit
+import mmap
 import os
 import re
-import uuid
 
 import MandateFactory
-from CryptoLedger import CryptoLedger
+from CryptoLedger import CryptoLedger, LEDGER_DELIMITER
+from JSONFactory import json_dumps_indented, json_intern_strings, json_loads
 from KeyManager import KeyManager
 from MandateSigner import MandateSigner
 from PaymentProcessor import PaymentProcessor
 
+try:
+    import readline
+except ImportError:
+    readline = None  # e.g. Windows; prompts still work, just without completion
+
+
+# keyword dispatch for agent_parse_command: one alternation per command family, matched
+# as a substring of the lowercased command exactly like the former `word in text` tests
+_PAYMENT_WORDS = re.compile("payment|send|pay")
+_FRAUD_WORDS = re.compile("fraud|flag")
+_INTENT_WORDS = re.compile("intent|buy|purchase")
+_FILE_WORDS = re.compile("file|use|insert")
+_QUIT_WORDS = frozenset(("quit", "exit", "q"))
+_LEADING_WS = re.compile(rb"\s*")
+# currencies agent_extract_amount_currency understands, offered as Tab completions
+_CURRENCIES = ("AUD", "CHF", "CNY", "CZK", "EUR", "GBP", "KRW", "NZD", "USD")
+
+# field extractors, compiled once at import. The amount/currency pattern stays a regex: sre's
+# C matcher beats a hand-written per-character scanner on command-length strings
+_AMT_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(eur|usd|czk|gbp|krw|nzd|aud|chf|cny)", re.IGNORECASE)
+_RUN_RE = re.compile(r"settlement\s+run\s+(\w+)", re.IGNORECASE)
+_SENDER_RE = re.compile(r"\bfrom\s+([A-Za-z0-9:_-]+)", re.IGNORECASE)
+_RECV_RE = re.compile(r"\bto\s+([A-Za-z0-9:_-]+)", re.IGNORECASE)
+_VCID_RE = re.compile(r"\burn:uuid:[a-f0-9\-]{36}\b", re.IGNORECASE)
+_PATH_RE = re.compile(r"(\S+\.json)", re.IGNORECASE)
+_NOTE_RE = re.compile(r"\bfor\s+([A-Za-z0-9\s\-_,.]+)", re.IGNORECASE)
+
+
+def _new_txn_id() -> str:
+    return "txn-" + MandateFactory.mandate_new_id()
+
 
 # global function
-def load_ledger_from_file(path: str, ledger: CryptoLedger):
+def iter_ledger_file(path: str):
+    """Yields the records of ledger.log one at a time, parsed from an mmap of the file."""
     if not os.path.exists(path):
         return
-    with open(path, "r", encoding="utf-8") as f:
-        content = f.read()
-    entries = content.split("----- TRANSACTION COMPLETED -----")
-    for entry in entries:
-        entry = entry.strip()
-        if not entry or not entry.startswith("{"):
-            continue
-        try:
-            txn = json.loads(entry)
-            ledger.transactions.append(txn)
-        except Exception as e:
-            print(f"[load] failed to parse entry: {e}")
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        if os.fstat(fd).st_size == 0:
+            return
+        with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+            if hasattr(mm, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            size = len(mm)
+            start = 0
+            while start < size:
+                end = mm.find(LEDGER_DELIMITER, start)
+                if end == -1:
+                    end = size
+                first = _LEADING_WS.match(mm, start, end).end()
+                start = end + len(LEDGER_DELIMITER)
+                if mm[first:first + 1] != b"{":
+                    continue
+                # trailing whitespace is valid JSON, so the slice needs no strip (and no copy)
+                entry = view[first:end]
+                # a schema-typed decoder (msgspec) buys nothing here: nearly all of an entry is
+                # free-form VC JSON, and a typed schema would drop keys it doesn't list
+                try:
+                    yield json_intern_strings(json_loads(entry))
+                except Exception as e:
+                    print(f"[load] failed to parse entry: {e}")
+                finally:
+                    entry.release()
+    finally:
+        os.close(fd)
+
+
+def load_ledger_from_file(path: str, ledger: CryptoLedger, verify: bool = False):
+    """Replays ledger.log; verify=True admits the records through ledger.add_transactions_bulk."""
+    if verify:
+        rejected = ledger.add_transactions_bulk(list(iter_ledger_file(path))).count(False)
+        if rejected:
+            print(f"[load] {rejected} ledger entries failed verification")
+    else:
+        ledger.transactions.extend(iter_ledger_file(path))
 
 
 class AgentPrompt:
@@ -71,14 +131,37 @@ class AgentPrompt:
         self.mandate_factory = mandate_factory
         self.ledger = ledger
         self.ledger_file = ledger_file
+        # open the append descriptor up front so the first commit doesn't pay for it
+        self.ledger.ledger_open(ledger_file)
+        atexit.register(self.ledger.close)
+        # last committed values; empty answers to the matching prompts fall back to these
+        self._defaults = {"currency": "EUR", "receiver": None}
+        self._choices = ()
+        if readline is not None:
+            readline.set_completer(self.agent_complete)
+            readline.set_completer_delims(" \t\n")
+            readline.parse_and_bind("tab: complete")
 
     def run_payment_process(self):
+        mf = self.mandate_factory
+        proc = self.processor
         while True:
             cmd = input("AP2> ").strip()
             if not cmd:
                 continue
-            if cmd.lower() in ("quit", "exit", "q"):
+            cmd_lower = cmd.lower()
+            if cmd_lower in _QUIT_WORDS:
                 break
+            # a colon prefix, so free-text prompts starting with "batch" still reach the parser
+            if cmd_lower.startswith(":batch "):
+                try:
+                    with open(cmd[7:].strip(), "r", encoding="utf-8") as f:
+                        self.run_batch([line.strip() for line in f if line.strip()])
+                except OSError as e:
+                    print(f"[Agent] Failed to read batch file: {e}")
+                except Exception as e:
+                    print(f"[runtime] error: {e}")
+                continue
 
             action, params = self.agent_parse_command(cmd)
 
@@ -90,11 +173,11 @@ class AgentPrompt:
 
                     currency = params.get("currency")
                     if currency is None:
-                        currency = input("Currency (default EUR): ").strip().upper() or "EUR"
+                        currency = self.agent_ask("Currency", "currency").upper()
 
                     receiver = params.get("receiver")
                     if receiver is None:
-                        receiver = input("Receiver (merchant id): ").strip()
+                        receiver = self.agent_ask("Receiver (merchant id)", "receiver")
 
                     note = params.get("note")
                     if not note:
@@ -102,69 +185,19 @@ class AgentPrompt:
                     sender = params.get("sender") or "issuer:user-wallet"
 
                     settlement_run = params.get("settlement_run")
-                    if settlement_run is None and "settlement run" in cmd.lower():
+                    if settlement_run is None and "settlement run" in cmd_lower:
                         settlement_run = input("Settlement run: ").strip().upper()
 
-                    intent_vc = self.mandate_factory.sending(
-                        self.processor.sending_signer,
+                    intent_vc = mf.sending(
+                        proc.sending_signer,
                         receiver=receiver,
                         amount=amount,
                         currency=currency,
                         note=cmd.strip()
                     )
-                    cart_vc = self.mandate_factory.checkout(
-                        self.processor.checkout_signer,
-                        receiver=receiver,
-                        amount=amount,
-                        currency=currency,
-                        prev_mandate_id=intent_vc["id"],
-                        item_desc=note
+                    self.transaction_build_and_commit(
+                        intent_vc, sender, receiver, amount, currency, note, settlement_run
                     )
-                    txn_id = f"txn-{uuid.uuid4()}"
-
-                    if settlement_run in ("MISC", "ADD1", None):
-                        payment_vc = self.mandate_factory.confirmation(
-                            self.processor.confirmation_signer,
-                            receiver=receiver,
-                            amount=amount,
-                            currency=currency,
-                            txn_id=txn_id,
-                            prev_mandate_id=cart_vc["id"],
-                            cart_vc=cart_vc
-                        )
-                        mandates = [intent_vc, cart_vc, payment_vc]
-                    else:
-                        netting_vc = self.mandate_factory.netting(
-                            self.processor.netting_signer,
-                            prev_ids=[cart_vc["id"]],
-                            counterparty=receiver,
-                            currency=currency,
-                            amount=amount,
-                            settlement_run=settlement_run
-                        )
-
-                        print("[Agent] Netting Finished.")
-
-                        payment_vc = self.mandate_factory.confirmation(
-                            self.processor.confirmation_signer,
-                            receiver=receiver,
-                            amount=amount,
-                            currency=currency,
-                            txn_id=txn_id,
-                            prev_mandate_id=netting_vc["id"],
-                            cart_vc=cart_vc
-                        )
-                        mandates = [intent_vc, cart_vc, netting_vc, payment_vc]
-
-                    txn = {
-                        "transaction_id": txn_id,
-                        "sender": sender,
-                        "receiver": receiver,
-                        "amount": amount,
-                        "currency": currency,
-                        "mandates": mandates
-                    }
-                    self.transaction_commit(txn)
 
                 elif action == "intent":
                     # Prompt for missing fields if any are missing after the prompt
@@ -173,24 +206,24 @@ class AgentPrompt:
                         amount = float(input("Amount: ").strip())
                     currency = params.get("currency")
                     if currency is None:
-                        currency = input("Currency (default EUR): ").strip().upper() or "EUR"
+                        currency = self.agent_ask("Currency", "currency").upper()
                     receiver = params.get("receiver")
                     if receiver is None:
-                        receiver = input("Receiver (merchant id): ").strip()
+                        receiver = self.agent_ask("Receiver (merchant id)", "receiver")
                     note = params.get("note")
                     if not note:
                         note = input("Item description (note): ").strip() or "Generic Item"
                     sender = params.get("sender") or "issuer:user-wallet"
                     raw_intent = {
                         "natural_language_description": note,
-                        "intent_expiry": self.mandate_factory.mandate_expiry(1),
+                        "intent_expiry": mf.mandate_expiry(1),
                         "user_cart_confirmation_required": True,
                         "merchants": [receiver],
                         "skus": [],
                         "required_refundability": True
                     }
-                    intent_vc = self.mandate_factory.sending(
-                        self.processor.sending_signer,
+                    intent_vc = mf.sending(
+                        proc.sending_signer,
                         receiver=receiver,
                         amount=amount,
                         currency=currency,
@@ -198,7 +231,7 @@ class AgentPrompt:
                         raw_intent=raw_intent
                     )
                     txn = {
-                        "transaction_id": f"txn-{os.urandom(4).hex()}",
+                        "transaction_id": _new_txn_id(),
                         "sender": sender,
                         "receiver": receiver,
                         "amount": amount,
@@ -212,8 +245,8 @@ class AgentPrompt:
                     if not path:
                         print("[Agent] No JSON file path detected in your command.")
                         return
-                    with open(path, "r", encoding="utf-8") as f:
-                        raw_msg = json.load(f)
+                    with open(path, "rb") as f:
+                        raw_msg = json_loads(f.read())
                     try:
                         intent_payload = raw_msg["parts"][0]["data"]["ap2.mandates.IntentMandate"]
                     except Exception as e:
@@ -224,16 +257,16 @@ class AgentPrompt:
                         note = input("Item description (note): ").strip() or "Generic Item"
                     expiry = intent_payload.get("intent_expiry")
                     amount = float(input("Amount for this intent: ").strip())
-                    currency = input("Currency (default EUR): ").strip().upper() or "EUR"
-                    receiver = input("Receiver (merchant id): ").strip()
+                    currency = self.agent_ask("Currency", "currency").upper()
+                    receiver = self.agent_ask("Receiver (merchant id)", "receiver")
                     sender = params.get("sender") or "issuer:user-wallet"
                     settlement_run = None
 
                     # The below wraps Intents into VC Mandates
-                    if "settlement run" in cmd.lower():
+                    if "settlement run" in cmd_lower:
                         settlement_run = input("Settlement run: ").strip().upper()
-                    intent_vc = self.mandate_factory.sending(
-                        self.processor.sending_signer,
+                    intent_vc = mf.sending(
+                        proc.sending_signer,
                         receiver=receiver,
                         amount=amount,
                         currency=currency,
@@ -243,59 +276,10 @@ class AgentPrompt:
 
                     if expiry:
                         intent_vc["expirationDate"] = expiry
-                    cart_vc = self.mandate_factory.checkout(
-                        self.processor.checkout_signer,
-                        receiver=receiver,
-                        amount=amount,
-                        currency=currency,
-                        prev_mandate_id=intent_vc["id"],
-                        item_desc=note
+                    self.transaction_build_and_commit(
+                        intent_vc, sender, receiver, amount, currency, note, settlement_run
                     )
 
-                    txn_id = f"txn-{uuid.uuid4()}"
-                    if settlement_run in ("MISC", "ADD1", None):
-                        payment_vc = self.mandate_factory.confirmation(
-                            self.processor.confirmation_signer,
-                            receiver=receiver,
-                            amount=amount,
-                            currency=currency,
-                            txn_id=txn_id,
-                            prev_mandate_id=cart_vc["id"],
-                            cart_vc=cart_vc
-                        )
-                        mandates = [intent_vc, cart_vc, payment_vc]
-                    else:
-                        netting_vc = self.mandate_factory.netting(
-                            self.processor.netting_signer,
-                            prev_ids=[cart_vc["id"]],
-                            counterparty=receiver,
-                            currency=currency,
-                            amount=amount,
-                            settlement_run=settlement_run
-                        )
-
-                        print("[Agent] Netting Finished.")
-
-                        payment_vc = self.mandate_factory.confirmation(
-                            self.processor.confirmation_signer,
-                            receiver=receiver,
-                            amount=amount,
-                            currency=currency,
-                            txn_id=txn_id,
-                            prev_mandate_id=netting_vc["id"],
-                            cart_vc=cart_vc
-                        )
-                        mandates = [intent_vc, cart_vc, netting_vc, payment_vc]
-                    txn = {
-                        "transaction_id": txn_id,
-                        "sender": sender,
-                        "receiver": receiver,
-                        "amount": amount,
-                        "currency": currency,
-                        "mandates": mandates
-                    }
-                    self.transaction_commit(txn)
-
                 elif action == "refund":
                     amount = params.get("amount")
                     currency = params.get("currency")
@@ -306,7 +290,7 @@ class AgentPrompt:
                         if not reason:
                             reason = "unspecified"
 
-                    txn = self.processor.process_refund(
+                    txn = proc.process_refund(
                         vc_id=payment_id,
                         amount=amount,
                         currency=currency,
@@ -326,12 +310,12 @@ class AgentPrompt:
                     evidence = {}
                     if evidence_path and os.path.exists(evidence_path):
                         try:
-                            with open(evidence_path, "r", encoding="utf-8") as f:
-                                evidence = json.load(f)
+                            with open(evidence_path, "rb") as f:
+                                evidence = json_loads(f.read())
                         except Exception as e:
                             print(f"[Agent] Failed to load evidence file: {e}")
 
-                    txn = self.processor.process_fraud_flag(
+                    txn = proc.process_fraud_flag(
                         flagged_vc_id=flagged_id,
                         reason=reason,
                         evidence=evidence
@@ -347,13 +331,14 @@ class AgentPrompt:
 
     def agent_parse_command(self, cmd: str):
         text = cmd.strip()
+        text_lower = text.lower()
 
         # Payment
-        if any(word in text.lower() for word in ("payment", "send", "pay")):
+        if _PAYMENT_WORDS.search(text_lower):
             amt, cur = self.agent_extract_amount_currency(text)
 
             # Extract settlement run
-            m_run = re.search(r"settlement\s+run\s+(\w+)", text, re.IGNORECASE)
+            m_run = _RUN_RE.search(text)
             settlement_run = m_run.group(1).upper() if m_run else None
 
             # Extract senders and receivers
@@ -361,8 +346,7 @@ class AgentPrompt:
             receiver = self.agent_extract_receiver(text)
 
             # Extract note (for xxx)
-            m_note = re.search(r"\bfor\s+([A-Za-z0-9\s\-_,.]+)", text, re.IGNORECASE)
-            note = m_note.group(1).strip() if m_note else "Generic Item"
+            note = self.agent_extract_note(text)
 
             return "payment", {
                 "amount": amt,
@@ -374,7 +358,7 @@ class AgentPrompt:
             }
 
         # Refund
-        if "refund" in text.lower():
+        if "refund" in text_lower:
             amt, cur = self.agent_extract_amount_currency(text)
             vc_id = self.agent_extract_vc_id(text)
             if not vc_id:
@@ -387,7 +371,7 @@ class AgentPrompt:
             }
 
         # Fraud
-        if "fraud" in text.lower() or "flag" in text.lower():
+        if _FRAUD_WORDS.search(text_lower):
             vc_id = self.agent_extract_vc_id(text)
             evidence = self.agent_extract_path(text)
             if vc_id:
@@ -397,8 +381,8 @@ class AgentPrompt:
                 }
 
         # Intent
-        if any(word in text.lower() for word in ("intent", "buy", "purchase")):
-            if any(word in text.lower() for word in ("file", "use", "insert")):
+        if _INTENT_WORDS.search(text_lower):
+            if _FILE_WORDS.search(text_lower):
                 path = self.agent_extract_path(cmd)
                 return "intent_raw", {"path": path}
             amt, cur = self.agent_extract_amount_currency(text)
@@ -408,34 +392,152 @@ class AgentPrompt:
         return None, {}
 
     def agent_extract_amount_currency(self, text: str):
-        m = re.search(r"(\d+(?:\.\d+)?)\s*(eur|usd|czk|gbp|krw|nzd|aud|chf|cny)", text, re.IGNORECASE)
+        m = _AMT_RE.search(text)
         if m:
             return float(m.group(1)), m.group(2).upper()
         return None, "EUR"
 
     def agent_extract_sender(self, text: str):
-        m = re.search(r"\bfrom\s+([A-Za-z0-9:_-]+)", text, re.IGNORECASE)
+        m = _SENDER_RE.search(text)
         return m.group(1) if m else "issuer:user-wallet"
 
     def agent_extract_receiver(self, text: str):
-        m = re.search(r"\bto\s+([A-Za-z0-9:_-]+)", text, re.IGNORECASE)
+        m = _RECV_RE.search(text)
         return m.group(1) if m else "merchant"
 
     def agent_extract_vc_id(self, text: str):
-        m = re.search(r"\burn:uuid:[a-f0-9\-]{36}\b", text, re.IGNORECASE)
+        m = _VCID_RE.search(text)
         return m.group(0) if m else None
 
     def agent_extract_path(self, text: str):
-        m = re.search(r"(\S+\.json)", text, re.IGNORECASE)
+        m = _PATH_RE.search(text)
         return m.group(1) if m else None
 
     def agent_extract_note(self, text: str):
-        m = re.search(r"\bfor\s+([A-Za-z0-9\s\-_,.]+)", text, re.IGNORECASE)
+        m = _NOTE_RE.search(text)
         return m.group(1).strip() if m else "Generic Item"
 
+    def transaction_build_and_commit(self, intent_vc, sender, receiver, amount, currency, note, settlement_run):
+        """Chains the cart, optional netting and payment Mandates onto a signed intent and commits it."""
+        mf = self.mandate_factory
+        proc = self.processor
+        cart_vc = mf.checkout(
+            proc.checkout_signer,
+            receiver=receiver,
+            amount=amount,
+            currency=currency,
+            prev_mandate_id=intent_vc["id"],
+            item_desc=note
+        )
+        txn_id = _new_txn_id()
+
+        if settlement_run in ("MISC", "ADD1", None):
+            payment_vc = mf.confirmation(
+                proc.confirmation_signer,
+                receiver=receiver,
+                amount=amount,
+                currency=currency,
+                txn_id=txn_id,
+                prev_mandate_id=cart_vc["id"],
+                cart_vc=cart_vc
+            )
+            mandates = [intent_vc, cart_vc, payment_vc]
+        else:
+            netting_vc = mf.netting(
+                proc.netting_signer,
+                prev_ids=[cart_vc["id"]],
+                counterparty=receiver,
+                currency=currency,
+                amount=amount,
+                settlement_run=settlement_run
+            )
+
+            print("[Agent] Netting Finished.")
+
+            payment_vc = mf.confirmation(
+                proc.confirmation_signer,
+                receiver=receiver,
+                amount=amount,
+                currency=currency,
+                txn_id=txn_id,
+                prev_mandate_id=netting_vc["id"],
+                cart_vc=cart_vc
+            )
+            mandates = [intent_vc, cart_vc, netting_vc, payment_vc]
+
+        txn = {
+            "transaction_id": txn_id,
+            "sender": sender,
+            "receiver": receiver,
+            "amount": amount,
+            "currency": currency,
+            "mandates": mandates
+        }
+        self.transaction_commit(txn)
+
+    def run_batch(self, cmds: list[str]) -> list[bool]:
+        """Replays scripted payment commands as one signed batch, skipping incomplete ones."""
+        jobs = []
+        for cmd in cmds:
+            action, params = self.agent_parse_command(cmd)
+            if action != "payment" or params.get("amount") is None:
+                print(f"[Agent] Batch skips (not a complete payment): {cmd}")
+                continue
+            jobs.append((cmd, params))
+        if not jobs:
+            return []
+
+        txns = self.processor.build_payments([
+            {
+                "sender": p["sender"],
+                "receiver": p["receiver"],
+                "amount": p["amount"],
+                "currency": p["currency"],
+                "note": cmd.strip(),
+                "item_desc": p["note"],
+                "settlement_run": None if p["settlement_run"] in ("MISC", "ADD1") else p["settlement_run"],
+            }
+            for cmd, p in jobs
+        ], self.mandate_factory)
+
+        results = self.ledger.add_transactions_batch(txns)
+        accepted = [txn for txn, ok in zip(txns, results) if ok]
+        self.ledger.save_all_to_file(self.ledger_file, accepted)
+        if accepted:
+            self.agent_remember_defaults(accepted[-1])
+        print(f"[Agent] Batch: {len(accepted)} committed, {len(txns) - len(accepted)} rejected.")
+        return results
+
+    def agent_complete(self, text: str, state: int):
+        """readline completer over the candidates of the field being prompted for."""
+        prefix = text.lower()
+        matches = [c for c in self._choices if c.lower().startswith(prefix)]
+        return matches[state] if state < len(matches) else None
+
+    def agent_ask(self, label: str, field: str) -> str:
+        """Prompts for a field, with Tab completion and the last committed value as the default."""
+        default = self._defaults.get(field)
+        self._choices = _CURRENCIES if field == "currency" else (default,) if default else ()
+        try:
+            answer = input(f"{label} [{default}]: " if default else f"{label}: ").strip()
+        finally:
+            self._choices = ()
+        return answer or default or ""
+
+    def agent_remember_defaults(self, txn) -> None:
+        """Makes a committed payment's non-blank currency and receiver the prompt defaults."""
+        mandates = txn.get("mandates") or ()
+        if not mandates or mandates[0].get("type", [None])[-1] != "IntentMandate":
+            return
+        for field in ("currency", "receiver"):
+            value = txn.get(field)
+            if isinstance(value, str) and value.strip():
+                self._defaults[field] = value
+
     def transaction_commit(self, txn):
         ok = self.ledger.add_transaction(txn)
         if ok:
+            self.agent_remember_defaults(txn)
             self.ledger.save_to_file(self.ledger_file, txn)
             self.transaction_show_result(txn)
         else:
@@ -443,7 +545,7 @@ class AgentPrompt:
 
     def transaction_show_result(self, txn):
         print("\n[Agent] Transaction Result:")
-        print(json.dumps(txn, indent=2))
+        print(json_dumps_indented(txn).decode("utf-8"))
         self.ledger.transaction_report()
 
 
@@ -476,7 +578,10 @@ def main():
     mandate_factory = MandateFactory.MandateFactory("issuer:user-wallet")
 
     agent = AgentPrompt(processor, mandate_factory, ledger)
-    agent.run_payment_process()
+    try:
+        agent.run_payment_process()
+    finally:
+        ledger.close()
 
 
 if __name__ == "__main__":
@@ -28,11 +28,51 @@ Google announcement: https://cloud.google.com/blog/products/ai-machine-learning/
 """
 
 import hashlib
+import os
 import time
-import uuid
 from typing import Dict, Any, Optional
 
-import base58
+from Base58Codec import b58encode
+from JSONFactory import json_cache_bytes, json_canonical_bytes
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+# (epoch second, formatted) of the last call; one tuple, so a racing thread sees either
+# the old pair or the new one, and at worst formats the same second twice
+_TS_CACHE = [(-1, "")]
+_EXPIRY_CACHE = [(-1, "")]
+
+
+def _mandate_format_utc(epoch: int, cache: list) -> str:
+    cached_epoch, formatted = cache[0]
+    if cached_epoch != epoch:
+        formatted = time.strftime(TIMESTAMP_FORMAT, time.gmtime(epoch))
+        cache[0] = (epoch, formatted)
+    return formatted
+
+
+def mandate_new_id() -> str:
+    """Random 128-bit id as 32 hex digits, for the ids inside a Mandate and transaction ids."""
+    return os.urandom(16).hex()
+
+
+def mandate_new_vc_id() -> str:
+    """'urn:uuid:' + a dashed UUIDv4, formatted from os.urandom without building a uuid.UUID."""
+    b = bytearray(os.urandom(16))
+    b[6] = (b[6] & 0x0F) | 0x40  # version 4
+    b[8] = (b[8] & 0x3F) | 0x80  # RFC 4122 variant
+    h = b.hex()
+    return f"urn:uuid:{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+
+def mandate_utc_now() -> str:
+    """Current UTC time as an xsd:dateTime; strftime only runs once per second."""
+    return _mandate_format_utc(int(time.time()), _TS_CACHE)
+
+
+def mandate_utc_in(seconds: int) -> str:
+    """UTC time `seconds` from now, cached like mandate_utc_now."""
+    return _mandate_format_utc(int(time.time()) + seconds, _EXPIRY_CACHE)
 
 
 class MandateFactory:
@@ -48,11 +88,11 @@ class MandateFactory:
 
     @staticmethod
     def mandate_timestamp() -> str:
-        return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        return mandate_utc_now()
 
     @staticmethod
     def mandate_expiry(hours: int = 1) -> str:
-        return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + hours * 3600))
+        return mandate_utc_in(hours * 3600)
 
     def mandate_wrap_vc(
             self,
@@ -67,7 +107,7 @@ class MandateFactory:
                 "https://ap2-protocol.org/contexts/mandates/v1",
                 "https://w3id.org/security/v2"
             ],
-            "id": f"urn:uuid:{uuid.uuid4()}",
+            "id": mandate_new_vc_id(),
             "type": ["VerifiableCredential", mandate_type],
             "issuer": signer.issuer_id,
             "issuanceDate": self.mandate_timestamp(),
@@ -82,7 +122,8 @@ class MandateFactory:
             },
             "credentialSubject": payload
         }
-        vc["proof"] = signer.sign(vc)
+        # one JSON pass: it keys the URDNA2015 cache the signer fills
+        vc["proof"] = signer.sign(vc, json_cache_bytes(vc))
         return vc
 
     def sending(
@@ -92,76 +133,52 @@ class MandateFactory:
             amount: float,
             currency: str,
             note: str = "",
-            raw_intent: Optional[Dict[str, Any]] = None
+            raw_intent: Optional[Dict[str, Any]] = None,
+            user_id: Optional[str] = None
     ) -> Dict[str, Any]:
+        """user_id overrides the factory's payer, so one factory can serve every sender."""
         expiration_override = None
-
+        intent_expiry = None
+        natural_desc = note
         if raw_intent:
             natural_desc = raw_intent.get("natural_language_description", note or "")
             intent_expiry = raw_intent.get("intent_expiry")
             if intent_expiry:
                 expiration_override = intent_expiry
 
-            payload = {
-                "label": "User intent to initiate payment",
-                "note": natural_desc,
-                "mandate_id": str(uuid.uuid4()),
-                "prev_mandate_id": None,
-                "merchant_id": receiver,
-                "payer_info": {
-                    "user_id": self.user_id,
-                    "credential_provider": "issuer:user-wallet"
-                },
-                "payee_info": {"merchant_id": receiver},
-                "payment_methods": ["card", "wallet"],
-                "shopping_intent": {
-                    "items": [
-                        {"description": natural_desc or "unspecified item", "price": amount, "currency": currency}],
-                    "total": amount
-                },
-                "prompt_playback": f"Send {amount} {currency} to {receiver}",
-                "ttl": intent_expiry or self.mandate_expiry(1),
-                "details": {
-                    "action": "send",
-                    "amount": amount,
-                    "currency": currency,
-                    "destination": receiver,
-                    "note": natural_desc
-                },
-                "user_cart_confirmation_required": raw_intent.get("user_cart_confirmation_required"),
-                "natural_language_description": natural_desc,
-                "merchants": raw_intent.get("merchants"),
-                "skus": raw_intent.get("skus"),
-                "required_refundability": raw_intent.get("required_refundability"),
-                "intent_expiry": intent_expiry,
-            }
-        else:
-            payload = {
-                "label": "User intent to initiate payment",
-                "note": note,
-                "mandate_id": str(uuid.uuid4()),
-                "prev_mandate_id": None,
-                "merchant_id": receiver,
-                "payer_info": {
-                    "user_id": self.user_id,
-                    "credential_provider": "issuer:user-wallet"
-                },
-                "payee_info": {"merchant_id": receiver},
-                "payment_methods": ["card", "wallet"],
-                "shopping_intent": {
-                    "items": [{"description": note or "unspecified item", "price": amount, "currency": currency}],
-                    "total": amount
-                },
-                "prompt_playback": f"Send {amount} {currency} to {receiver}",
-                "ttl": self.mandate_expiry(1),
-                "details": {
-                    "action": "send",
-                    "amount": amount,
-                    "currency": currency,
-                    "destination": receiver,
-                    "note": note
-                }
+        payload = {
+            "label": "User intent to initiate payment",
+            "note": natural_desc,
+            "mandate_id": mandate_new_id(),
+            "prev_mandate_id": None,
+            "merchant_id": receiver,
+            "payer_info": {
+                "user_id": user_id or self.user_id,
+                "credential_provider": "issuer:user-wallet"
+            },
+            "payee_info": {"merchant_id": receiver},
+            "payment_methods": ["card", "wallet"],
+            "shopping_intent": {
+                "items": [{"description": natural_desc or "unspecified item", "price": amount, "currency": currency}],
+                "total": amount
+            },
+            "prompt_playback": f"Send {amount} {currency} to {receiver}",
+            "ttl": intent_expiry or self.mandate_expiry(1),
+            "details": {
+                "action": "send",
+                "amount": amount,
+                "currency": currency,
+                "destination": receiver,
+                "note": natural_desc
             }
+        }
+        if raw_intent:
+            payload["user_cart_confirmation_required"] = raw_intent.get("user_cart_confirmation_required")
+            payload["natural_language_description"] = natural_desc
+            payload["merchants"] = raw_intent.get("merchants")
+            payload["skus"] = raw_intent.get("skus")
+            payload["required_refundability"] = raw_intent.get("required_refundability")
+            payload["intent_expiry"] = intent_expiry
 
         return self.mandate_wrap_vc(signer, "IntentMandate", payload, expiration=expiration_override)
 
@@ -174,7 +191,7 @@ class MandateFactory:
             prev_mandate_id: str,
             item_desc: str = "Generic Item"
     ) -> Dict[str, Any]:
-        cart_id = str(uuid.uuid4())
+        cart_id = mandate_new_id()
         payment_request = {
             "id": cart_id,
             "method_data": [{"supportedMethods": ["basic-card", "https://example.com/pay"]}],
@@ -186,11 +203,11 @@ class MandateFactory:
         payload = {
             "label": "Merchant checkout confirmation",
             "note": item_desc,
-            "mandate_id": str(uuid.uuid4()),
+            "mandate_id": mandate_new_id(),
             "prev_mandate_id": prev_mandate_id,
             "merchant_id": receiver,
             "contents": {"id": cart_id, "payment_request": payment_request},
-            "merchant_signature": f"sig-{uuid.uuid4().hex}",
+            "merchant_signature": "sig-" + mandate_new_id(),
             "timestamp": self.mandate_timestamp()
         }
         return self.mandate_wrap_vc(signer, "CartMandate", payload)
@@ -205,12 +222,12 @@ class MandateFactory:
             prev_mandate_id: str,
             cart_vc: Dict[str, Any]
     ) -> Dict[str, Any]:
-        cart_bytes = str(cart_vc).encode("utf-8")
-        cart_hash_b58 = base58.b58encode(hashlib.sha256(cart_bytes).digest()).decode("ascii")
+        cart_bytes = json_canonical_bytes(cart_vc)
+        cart_hash_b58 = b58encode(hashlib.sha256(cart_bytes).digest()).decode("ascii")
         payload = {
             "label": f"Finalized payment for transaction {txn_id}",
             "note": f"Payment of {amount} {currency} to {receiver}",
-            "mandate_id": str(uuid.uuid4()),
+            "mandate_id": mandate_new_id(),
             "prev_mandate_id": prev_mandate_id,
             "merchant_id": receiver,
             "cart_mandate_hash": cart_hash_b58,
@@ -240,7 +257,7 @@ class MandateFactory:
         payload = {
             "label": f"Refund issued for payment {original_payment_id}",
             "note": reason,
-            "refund_id": str(uuid.uuid4()),
+            "refund_id": mandate_new_id(),
             "original_payment_id": original_payment_id,
             "prev_mandate_id": prev_mandate_id,
             "refund_amount": amount,
@@ -264,7 +281,7 @@ class MandateFactory:
         payload = {
             "label": f"Fraud flag raised for mandate {flagged_mandate_id}",
             "note": reason,
-            "flag_id": str(uuid.uuid4()),
+            "flag_id": mandate_new_id(),
             "flagged_mandate_id": flagged_mandate_id,
             "prev_mandate_id": prev_mandate_id,
             "fraud_reason": reason,
@@ -287,7 +304,7 @@ class MandateFactory:
         payload = {
             "label": f"Netting obligation for settlement run {settlement_run}",
             "note": f"Netting {amount}",
-            "mandate_id": str(uuid.uuid4()),
+            "mandate_id": mandate_new_id(),
             "prev_mandate_id": prev_ids[0],
             "prev_mandate_ids": prev_ids,
             "timestamp": self.mandate_timestamp(),
@@ -27,15 +27,36 @@ Google announcement: https://cloud.google.com/blog/products/ai-machine-learning/
 # SOFTWARE.
 """
 
-import time
-from typing import Dict, Any
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
 
-import base58
+from nacl.bindings import crypto_sign_open
 from nacl.exceptions import BadSignatureError
-from nacl.signing import VerifyKey
+from nacl.signing import SigningKey, VerifyKey
 
+from Base58Codec import b58decode, b58encode
 from JSONFactory import json_canonicalize_vc_for_signing
 from KeyManager import KeyManager
+from MandateFactory import mandate_utc_now
+from MerkleTree import merkle_build, merkle_leaf, merkle_root_from_path
+
+# a batch-signed Mandate: proofValue signs a Merkle root, merklePath proves the VC is under it
+MERKLE_PROOF_TYPE = "Ed25519MerkleSignature2025"
+
+# raw pubkey -> VerifyKey, so verify() doesn't rebuild one per Mandate
+VERIFY_KEY_CACHE_SIZE = 1024
+_verify_keys: "OrderedDict[bytes, VerifyKey]" = OrderedDict()
+
+
+def _verify_key(pubkey: bytes) -> VerifyKey:
+    vk = _verify_keys.get(pubkey)
+    if vk is None:
+        vk = _verify_keys[pubkey] = VerifyKey(pubkey)
+        if len(_verify_keys) > VERIFY_KEY_CACHE_SIZE:
+            _verify_keys.popitem(last=False)
+    else:
+        _verify_keys.move_to_end(pubkey)
+    return vk
 
 
 class MandateSigner:
@@ -46,21 +67,96 @@ class MandateSigner:
     def __init__(self, key_manager: KeyManager, issuer_id: str):
         self.key_manager = key_manager
         self.issuer_id = issuer_id
+        self._verification_method = f"{issuer_id}#keys-1"
+        # resolved on first use, so a signer may be built before its issuer's key exists;
+        # after regenerating the issuer's key, create a new MandateSigner
+        self._sk: Optional[SigningKey] = None
+
+    def sign(self, mandate_body: Dict[str, Any], body_json: Optional[bytes] = None) -> Dict[str, Any]:
+        return self.sign_many([mandate_body], None if body_json is None else [body_json])[0]
 
-    def sign(self, mandate_body: Dict[str, Any]) -> Dict[str, Any]:
-        body_bytes = json_canonicalize_vc_for_signing(mandate_body)
+    def sign_many(
+            self,
+            mandate_bodies: list[Dict[str, Any]],
+            bodies_json: Optional[list[Optional[bytes]]] = None
+    ) -> list[Dict[str, Any]]:
+        """Proofs for many Mandate bodies, in order; bodies_json optionally holds their json_cache_bytes."""
+        sk = self._sk
+        if sk is None:
+            sk = self._sk = self.key_manager.key_get_signer(self.issuer_id)
+        created = mandate_utc_now()
+        verification_method = self._verification_method
 
-        sk = self.key_manager.key_get_signer(self.issuer_id)
-        signature = sk.sign(body_bytes).signature
-        signature_b58 = base58.b58encode(signature).decode("ascii")
+        if bodies_json is None:
+            bodies_json = [None] * len(mandate_bodies)
+        proofs = []
+        for mandate_body, body_json in zip(mandate_bodies, bodies_json):
+            body_bytes = json_canonicalize_vc_for_signing(mandate_body, body_json)
+            signature = sk.sign(body_bytes).signature
+            proofs.append({
+                "type": "Ed25519Signature2020",
+                "created": created,
+                "verificationMethod": verification_method,
+                "proofPurpose": "assertionMethod",
+                "proofValue": b58encode(signature).decode("ascii"),
+            })
+        return proofs
+
+    def sign_batch(
+            self,
+            mandate_bodies: list[Dict[str, Any]],
+            bodies_json: Optional[list[Optional[bytes]]] = None
+    ) -> list[Dict[str, Any]]:
+        """Proofs for many Mandate bodies under one Ed25519 signature over their Merkle root."""
+        sk = self._sk
+        if sk is None:
+            sk = self._sk = self.key_manager.key_get_signer(self.issuer_id)
+        created = mandate_utc_now()
+
+        if bodies_json is None:
+            bodies_json = [None] * len(mandate_bodies)
+        leaves = [
+            merkle_leaf(json_canonicalize_vc_for_signing(body, body_json))
+            for body, body_json in zip(mandate_bodies, bodies_json)
+        ]
+        root, paths = merkle_build(leaves)
+        root_b58 = b58encode(root).decode("ascii")
+        signature_b58 = b58encode(sk.sign(root).signature).decode("ascii")
+        return [
+            {
+                "type": MERKLE_PROOF_TYPE,
+                "created": created,
+                "verificationMethod": self._verification_method,
+                "proofPurpose": "assertionMethod",
+                "merkleRoot": root_b58,
+                "merklePath": [[side, b58encode(sibling).decode("ascii")] for side, sibling in path],
+                "proofValue": signature_b58,
+            }
+            for path in paths
+        ]
+
+    @staticmethod
+    def signed_message(mandate: Dict[str, Any]) -> bytes:
+        """The bytes a Mandate's proofValue signs: its canonical body, or its checked Merkle root."""
+        proof = mandate["proof"]
+        body_bytes = json_canonicalize_vc_for_signing(mandate)
+        if proof.get("type") != MERKLE_PROOF_TYPE:
+            return body_bytes
+        root = b58decode(proof["merkleRoot"])
+        path = [(side, b58decode(sibling)) for side, sibling in proof["merklePath"]]
+        if merkle_root_from_path(merkle_leaf(body_bytes), path) != root:
+            raise ValueError("Merkle path does not lead to the signed root")
+        return root
 
-        return {
-            "type": "Ed25519Signature2020",
-            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-            "verificationMethod": f"{self.issuer_id}#keys-1",
-            "proofPurpose": "assertionMethod",
-            "proofValue": signature_b58,
-        }
+    @staticmethod
+    def signature_valid(triple: Tuple[bytes, bytes, bytes]) -> bool:
+        """Checks a (pubkey, message, signature) triple with libsodium directly, without building a VerifyKey."""
+        pubkey, message, sig = triple
+        try:
+            crypto_sign_open(sig + message, pubkey)
+            return True
+        except Exception:
+            return False
 
     @staticmethod
     def verify(mandate: Dict[str, Any], key_manager: KeyManager) -> bool:
@@ -68,16 +164,12 @@ class MandateSigner:
         if not proof:
             return False
 
-        mandate_copy = dict(mandate)
-        mandate_copy.pop("proof", None)
-        body_bytes = json_canonicalize_vc_for_signing(mandate_copy)
-
         try:
+            message = MandateSigner.signed_message(mandate)
             vm = proof["verificationMethod"]
             pubkey = key_manager.key_resolve_verification_method(vm)
-            sig = base58.b58decode(proof["proofValue"])
-            vk = VerifyKey(pubkey)
-            vk.verify(body_bytes, sig)
+            sig = b58decode(proof["proofValue"])
+            _verify_key(pubkey).verify(message, sig)
             return True
         except KeyError as e:
             print(f"[verify] missing field: {e}")
@@ -88,3 +180,29 @@ class MandateSigner:
         except Exception as e:
             print(f"[verify] verification error: {e}")
             return False
+
+
+class DeferredSigner:
+    """Queues the Mandates MandateFactory builds and signs them under one Merkle root on flush()."""
+    def __init__(self, signer: MandateSigner):
+        self.signer = signer
+        self.issuer_id = signer.issuer_id
+        self._pending: list[Tuple[Dict[str, Any], Optional[bytes], Dict[str, Any]]] = []
+
+    def sign(self, mandate_body: Dict[str, Any], body_json: Optional[bytes] = None) -> Dict[str, Any]:
+        proof: Dict[str, Any] = {}
+        self._pending.append((mandate_body, body_json, proof))
+        return proof
+
+    def flush(self) -> None:
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        bodies = [vc for vc, _, _ in pending]
+        bodies_json = [body_json for _, body_json, _ in pending]
+        if len(bodies) > 1:
+            proofs = self.signer.sign_batch(bodies, bodies_json)
+        else:
+            proofs = self.signer.sign_many(bodies, bodies_json)
+        for (_, _, proof), signed in zip(pending, proofs):
+            proof.update(signed)
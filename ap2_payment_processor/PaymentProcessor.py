@@ -27,12 +27,19 @@ Google announcement: https://cloud.google.com/blog/products/ai-machine-learning/
 # SOFTWARE.
 """
 
-import uuid
-from typing import Dict, Any
+import atexit
+import threading
+from concurrent.futures import Future
+from typing import Dict, Any, Optional, Tuple
 
 from CryptoLedger import CryptoLedger
-from MandateFactory import MandateFactory
-from MandateSigner import MandateSigner
+from MandateFactory import MandateFactory, mandate_new_id
+from MandateSigner import DeferredSigner, MandateSigner
+
+# submit_payment: how long the first payment of a batch waits for others, and when a full
+# batch is flushed without waiting
+BATCH_WINDOW = 0.05
+BATCH_MAX = 256
 
 
 class PaymentProcessor:
@@ -54,6 +61,15 @@ class PaymentProcessor:
         self.confirmation_signer = confirmation_signer
         self.netting_signer = netting_signer
         self.ledger_path = ledger_path
+        # one factory for every transaction; process_payment passes the sender as user_id
+        self.factory = MandateFactory(user_id="system")
+        self.batch_window = BATCH_WINDOW
+        self.batch_max = BATCH_MAX
+        self._pending: list[Tuple[Tuple[str, str, float, str, str], Future]] = []
+        self._pending_lock = threading.Lock()
+        self._flush_timer: Optional[threading.Timer] = None
+        # commit what is still queued when the program ends
+        atexit.register(self.close)
 
     def process_payment(
             self,
@@ -64,58 +80,206 @@ class PaymentProcessor:
             note: str = ""
     ) -> Dict[str, Any]:
         """Payment Processing and creation of VC Mandates from Raw Intents"""
-        txn_id = "txn-" + str(uuid.uuid4())
-
-        factory = MandateFactory(user_id=sender)
-
-        # IntentMandate VC
-        intent_vc = factory.sending(
-            self.sending_signer,
-            receiver,
-            amount,
-            currency,
-            note
-        )
-
-        # CartMandate VC
-        cart_vc = factory.checkout(
-            self.checkout_signer,
-            receiver,
-            amount,
-            currency,
-            intent_vc["id"],
-            item_desc=note or "Generic Item"
-        )
-
-        # PaymentMandate VC
-        payment_vc = factory.confirmation(
-            self.confirmation_signer,
-            receiver,
-            amount,
-            currency,
-            txn_id,
-            cart_vc["id"],
-            cart_vc
-        )
-
-        # Transaction Records
-        txn_record = {
-            "transaction_id": txn_id,
-            "sender": sender,
-            "receiver": receiver,
-            "amount": amount,
-            "currency": currency,
-            "mandates": [intent_vc, cart_vc, payment_vc],
-        }
-
-        ok = self.ledger.add_transaction(txn_record)
-        if ok:
-            self.ledger.save_to_file(self.ledger_path, txn_record)
-        else:
-            txn_record["error"] = (
-                "Ledger rejected transaction (signature, metadata, or chain validation failed)."
+        with self.ledger.lock:
+            txn_id = "txn-" + mandate_new_id()
+
+            factory = self.factory
+
+            # IntentMandate VC
+            intent_vc = factory.sending(
+                self.sending_signer,
+                receiver,
+                amount,
+                currency,
+                note,
+                user_id=sender
+            )
+
+            # CartMandate VC
+            cart_vc = factory.checkout(
+                self.checkout_signer,
+                receiver,
+                amount,
+                currency,
+                intent_vc["id"],
+                item_desc=note or "Generic Item"
             )
-        return txn_record
+
+            # PaymentMandate VC
+            payment_vc = factory.confirmation(
+                self.confirmation_signer,
+                receiver,
+                amount,
+                currency,
+                txn_id,
+                cart_vc["id"],
+                cart_vc
+            )
+
+            # Transaction Records
+            txn_record = {
+                "transaction_id": txn_id,
+                "sender": sender,
+                "receiver": receiver,
+                "amount": amount,
+                "currency": currency,
+                "mandates": [intent_vc, cart_vc, payment_vc],
+            }
+
+            ok = self.ledger.add_transaction(txn_record)
+            if ok:
+                self.ledger.save_to_file(self.ledger_path, txn_record)
+            else:
+                txn_record["error"] = (
+                    "Ledger rejected transaction (signature, metadata, or chain validation failed)."
+                )
+            return txn_record
+
+    def process_payments(self, payments: list[Tuple[str, str, float, str, str]]) -> list[Dict[str, Any]]:
+        """process_payment for many (sender, receiver, amount, currency, note) at once."""
+        return self._commit_payments(self._build_payment_tuples(payments))
+
+    def build_payments(
+            self,
+            payments: list[Dict[str, Any]],
+            factory: Optional[MandateFactory] = None
+    ) -> list[Dict[str, Any]]:
+        """Signed, not yet committed transaction records for many payments, in order."""
+        # each payment: sender, receiver, amount, currency, note (the intent's), item_desc (the
+        # cart's), and optionally user_id (the intent's payer) and settlement_run (adds netting)
+        with self.ledger.lock:
+            factory = factory or self.factory
+            sending = DeferredSigner(self.sending_signer)
+            intents = [
+                factory.sending(sending, p["receiver"], p["amount"], p["currency"], p["note"], user_id=p.get("user_id"))
+                for p in payments
+            ]
+            sending.flush()
+
+            checkout = DeferredSigner(self.checkout_signer)
+            carts = [
+                factory.checkout(
+                    checkout, p["receiver"], p["amount"], p["currency"], intent_vc["id"], item_desc=p["item_desc"]
+                )
+                for p, intent_vc in zip(payments, intents)
+            ]
+            checkout.flush()
+
+            netting = DeferredSigner(self.netting_signer)
+            nettings = [
+                None if p.get("settlement_run") is None else
+                factory.netting(netting, prev_ids=[cart_vc["id"]], counterparty=p["receiver"], currency=p["currency"],
+                                amount=p["amount"], settlement_run=p["settlement_run"])
+                for p, cart_vc in zip(payments, carts)
+            ]
+            netting.flush()
+
+            confirmation = DeferredSigner(self.confirmation_signer)
+            txns = []
+            for p, intent_vc, cart_vc, netting_vc in zip(payments, intents, carts, nettings):
+                txn_id = "txn-" + mandate_new_id()
+                payment_vc = factory.confirmation(
+                    confirmation, p["receiver"], p["amount"], p["currency"], txn_id,
+                    (netting_vc or cart_vc)["id"], cart_vc
+                )
+                mandates = [intent_vc, cart_vc, payment_vc] if netting_vc is None else \
+                    [intent_vc, cart_vc, netting_vc, payment_vc]
+                txns.append({
+                    "transaction_id": txn_id,
+                    "sender": p["sender"],
+                    "receiver": p["receiver"],
+                    "amount": p["amount"],
+                    "currency": p["currency"],
+                    "mandates": mandates,
+                })
+            confirmation.flush()
+            return txns
+
+    def _build_payment_tuples(self, payments: list[Tuple[str, str, float, str, str]]) -> list[Dict[str, Any]]:
+        return self.build_payments([
+            {
+                "sender": sender,
+                "receiver": receiver,
+                "amount": amount,
+                "currency": currency,
+                "note": note,
+                "item_desc": note or "Generic Item",
+                "user_id": sender,
+            }
+            for sender, receiver, amount, currency, note in payments
+        ])
+
+    def _commit_payments(self, txns: list[Dict[str, Any]]) -> list[Dict[str, Any]]:
+        results = self.ledger.add_transactions_batch(txns)
+        self.ledger.save_all_to_file(self.ledger_path, [txn for txn, ok in zip(txns, results) if ok])
+        for txn_record, ok in zip(txns, results):
+            if not ok:
+                txn_record["error"] = (
+                    "Ledger rejected transaction (signature, metadata, or chain validation failed)."
+                )
+        return txns
+
+    def submit_payment(
+            self,
+            sender: str,
+            receiver: str,
+            amount: float,
+            currency: str = "EUR",
+            note: str = ""
+    ) -> "Future[Dict[str, Any]]":
+        """Queues a payment for the next flush_batch and returns a Future of its transaction record."""
+        future: "Future[Dict[str, Any]]" = Future()
+        with self._pending_lock:
+            self._pending.append(((sender, receiver, amount, currency, note), future))
+            if len(self._pending) >= self.batch_max:
+                flush_now = True
+            else:
+                flush_now = False
+                if self._flush_timer is None:
+                    self._flush_timer = threading.Timer(self.batch_window, self.flush_batch)
+                    self._flush_timer.daemon = True
+                    self._flush_timer.start()
+        if flush_now:
+            self.flush_batch()
+        return future
+
+    def flush_batch(self) -> None:
+        """Commits the queued payments as one batch and resolves their futures."""
+        with self.ledger.lock:
+            with self._pending_lock:
+                pending, self._pending = self._pending, []
+                if self._flush_timer is not None:
+                    self._flush_timer.cancel()
+                    self._flush_timer = None
+            if not pending:
+                return
+
+            try:
+                txns = self._build_payment_tuples([payment for payment, _ in pending])
+            except Exception:
+                txns = None
+            if txns is None:
+                # sign each on its own, so one bad payment fails only its own future
+                for payment, future in pending:
+                    try:
+                        future.set_result(self.process_payment(*payment))
+                    except Exception as e:
+                        future.set_exception(e)
+                return
+            # built and signed: from here a failure must not re-run (and re-commit) any payment
+            try:
+                records = self._commit_payments(txns)
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+                return
+            for (_, future), txn_record in zip(pending, records):
+                future.set_result(txn_record)
+
+    def close(self) -> None:
+        """Commits the queued payments and waits until the ledger has written them."""
+        self.flush_batch()
+        self.ledger.ledger_sync()
 
     def process_refund(
             self,
@@ -124,44 +288,37 @@ class PaymentProcessor:
             currency: str,
             reason: str
     ) -> Dict[str, Any]:
-        if not vc_id.startswith("urn:uuid:"):
-            raise ValueError("Please provide the full VC id (e.g., urn:uuid:...)")
-
-        original_vc = None
-        for txn in self.ledger.transactions:
-            for m in txn.get("mandates", []):
-                if "PaymentMandate" in m.get("type", []) and m.get("id") == vc_id:
-                    original_vc = m
-                    break
-            if original_vc:
-                break
-
-        if not original_vc:
-            raise ValueError(f"No PaymentMandate found with VC id {vc_id}")
-
-        merchant_id = original_vc.get("credentialSubject", {}).get("merchant_id", " ")
-
-        factory = MandateFactory(user_id="system")
-        refund_vc = factory.refund(
-            signer=self.confirmation_signer,
-            original_payment_id=original_vc["id"],
-            prev_mandate_id=original_vc["id"],
-            amount=amount,
-            currency=currency,
-            reason=reason,
-            merchant_id=merchant_id,
-        )
-
-        txn_record = {
-            "transaction_id": "refund-" + str(uuid.uuid4()),
-            "sender": refund_vc["issuer"],
-            "receiver": merchant_id,
-            "amount": -amount,
-            "currency": currency,
-            "merchant_id": merchant_id,
-            "mandates": [refund_vc],
-        }
-        return txn_record
+        with self.ledger.lock:
+            if not vc_id.startswith("urn:uuid:"):
+                raise ValueError("Please provide the full VC id (e.g., urn:uuid:...)")
+
+            original_vc = self.ledger.ledger_find_vc(vc_id)
+            if not original_vc or "PaymentMandate" not in original_vc.get("type", []):
+                raise ValueError(f"No PaymentMandate found with VC id {vc_id}")
+
+            merchant_id = original_vc.get("credentialSubject", {}).get("merchant_id", " ")
+
+            factory = self.factory
+            refund_vc = factory.refund(
+                signer=self.confirmation_signer,
+                original_payment_id=original_vc["id"],
+                prev_mandate_id=original_vc["id"],
+                amount=amount,
+                currency=currency,
+                reason=reason,
+                merchant_id=merchant_id,
+            )
+
+            txn_record = {
+                "transaction_id": "refund-" + mandate_new_id(),
+                "sender": refund_vc["issuer"],
+                "receiver": merchant_id,
+                "amount": -amount,
+                "currency": currency,
+                "merchant_id": merchant_id,
+                "mandates": [refund_vc],
+            }
+            return txn_record
 
     def process_fraud_flag(
             self,
@@ -169,44 +326,38 @@ class PaymentProcessor:
             reason: str,
             evidence: Dict[str, Any]
     ) -> Dict[str, Any]:
-        if not flagged_vc_id.startswith("urn:uuid:"):
-            raise ValueError("Please provide the full VC id (urn:uuid:...)")
-
-        flagged_vc = None
-        for txn in self.ledger.transactions:
-            for m in txn.get("mandates", []):
-                if m.get("id") == flagged_vc_id:
-                    flagged_vc = m
-                    break
-            if flagged_vc:
-                break
-        if not flagged_vc:
-            raise ValueError(f"No mandate found with VC id {flagged_vc_id}")
-
-        subject = flagged_vc.get("credentialSubject", {})
-        merchant_id = subject.get("merchant_id", " ")
-        currency = (
-                subject.get("payment_details", {}).get("currency")
-                or subject.get("currency", " ")
-        )
-
-        factory = MandateFactory(user_id="system")
-        fraud_vc = factory.fraud_flag(
-            signer=self.confirmation_signer,
-            flagged_mandate_id=flagged_vc["id"],
-            prev_mandate_id=flagged_vc["id"],
-            reason=reason,
-            evidence=evidence,
-            merchant_id=merchant_id,
-            currency=currency,
-        )
-
-        txn_record = {
-            "transaction_id": "fraud-" + str(uuid.uuid4()),
-            "sender": fraud_vc["issuer"],
-            "receiver": merchant_id,
-            "amount": 0.0,
-            "currency": currency,
-            "mandates": [fraud_vc],
-        }
-        return txn_record
+        with self.ledger.lock:
+            if not flagged_vc_id.startswith("urn:uuid:"):
+                raise ValueError("Please provide the full VC id (urn:uuid:...)")
+
+            flagged_vc = self.ledger.ledger_find_vc(flagged_vc_id)
+            if not flagged_vc:
+                raise ValueError(f"No mandate found with VC id {flagged_vc_id}")
+
+            subject = flagged_vc.get("credentialSubject", {})
+            merchant_id = subject.get("merchant_id", " ")
+            currency = (
+                    subject.get("payment_details", {}).get("currency")
+                    or subject.get("currency", " ")
+            )
+
+            factory = self.factory
+            fraud_vc = factory.fraud_flag(
+                signer=self.confirmation_signer,
+                flagged_mandate_id=flagged_vc["id"],
+                prev_mandate_id=flagged_vc["id"],
+                reason=reason,
+                evidence=evidence,
+                merchant_id=merchant_id,
+                currency=currency,
+            )
+
+            txn_record = {
+                "transaction_id": "fraud-" + mandate_new_id(),
+                "sender": fraud_vc["issuer"],
+                "receiver": merchant_id,
+                "amount": 0.0,
+                "currency": currency,
+                "mandates": [fraud_vc],
+            }
+            return txn_record